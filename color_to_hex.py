@@ -1,11 +1,25 @@
-from flask import Flask, request, render_template_string, jsonify, flash
+from flask import Flask, request, jsonify, flash, send_file, abort
 from PIL import Image, ImageColor
 import io
-import base64
+import math
 import os
+import uuid
 import difflib
+import heapq
+import hashlib
 import re
-import colorsys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+# rapidfuzz (C++ Levenshtein) is optional; fuzzy_lookup falls back to difflib.
+try:
+    from rapidfuzz import process as _rf_process, fuzz as _rf_fuzz
+    _FUZZY = 'rapidfuzz'
+except ImportError:
+    _FUZZY = 'difflib'
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "replace-with-a-secure-random-key")
@@ -25,30 +39,39 @@ except Exception:
         "crimson": "#DC143C", "maroon": "#800000", "orange": "#FFA500",
         "pink": "#FFC0CB", "purple": "#800080", "violet": "#EE82EE",
         "brown": "#A52A2A", "gray": "#808080", "grey": "#808080",
-        "silver": "#C0C0C0", "gold": "#D4AF37", "beige": "#F5F5DC",
+        "silver": "#C0C0C0", "gold": "#FFD700", "beige": "#F5F5DC",
         "olive": "#808000", "lime": "#00FF00", "navy": "#000080",
         "teal": "#008080", "magenta": "#FF00FF", "coral": "#FF7F50",
         "salmon": "#FA8072", "turquoise": "#40E0D0", "indigo": "#4B0082", "burgundy": "#800020"
     }
 
+# Decode every CSS3 hex value once so name lookups never reparse it
+CSS3_NAMES_TO_RGB = {k: (int(v[1:3], 16), int(v[3:5], 16), int(v[5:7], 16)) for k, v in CSS3_NAMES_TO_HEX.items()}
+
 # Build a names list for fuzzy matching
 KNOWN_NAMES = sorted(CSS3_NAMES_TO_HEX.keys())
 
 # Helper utilities
 HEX_RE = re.compile(r"^#?[0-9a-fA-F]{6}$")
-RGB_RE = re.compile(r"rgb\s*\(\s*(\d{1,3})\s*,\s*(\d{1,3})\s*,\s*(\d{1,3})\s*\)")
 
 # New regexes and helpers for the integrated parser
-HEX_SHORT_RE = re.compile(r"^#?([0-9a-fA-F]{3})$")
-HEX_LONG_RE = re.compile(r"^#?([0-9a-fA-F]{6})$")
+HEX_DIGITS = frozenset("0123456789abcdef")
+# Uppercase two-digit hex for every byte value, used by rgb_to_hex
+_HEX2 = tuple(f"{i:02X}" for i in range(256))
 RGB_FUNC_RE = re.compile(r"rgba?\s*\(\s*([^)]*)\)")
 HSL_FUNC_RE = re.compile(r"hsla?\s*\(\s*([^)]*)\)")
 PLAIN_RGB_RE = re.compile(r"^\s*(\d{1,3})\s*[, \s]\s*(\d{1,3})\s*[, \s]\s*(\d{1,3})\s*$")
 PERC_RE = re.compile(r"^(\d{1,3})%$")
 
+# normalize_name helpers: control whitespace, '-' and '_' become spaces via translate
+_NAME_TRANSLATE = str.maketrans({c: " " for c in "\t\n\r_-"})
+_NAME_STRIP_RE = re.compile(r"[^a-z0-9#(),\s]")
+_WS_RE = re.compile(r"\s+")
+
 
 def clamp255(v):
-    return max(0, min(255, int(round(v))))
+    x = round(v)
+    return 0 if x < 0 else (255 if x > 255 else x)
 
 
 def parse_numeric_token(tok, is_percent_allowed=True):
@@ -67,19 +90,27 @@ def parse_numeric_token(tok, is_percent_allowed=True):
         raise ValueError(f"Can't parse token '{tok}' as numeric color component")
 
 
+# Which of (chroma, x, 0) goes to r, g, b for each 60-degree hue sector
+_HSL_SECTORS = ((0, 1, 2), (1, 0, 2), (2, 0, 1), (2, 1, 0), (1, 2, 0), (0, 2, 1))
+
+
 def hsl_to_rgb_tuple(h, s, l):
-    # h in degrees, s/l are 0..1 -> colorsys wants h 0..1 and uses HLS
-    r, g, b = colorsys.hls_to_rgb(h / 360.0, l, s)
-    return (clamp255(r * 255), clamp255(g * 255), clamp255(b * 255))
+    # h in degrees, s/l are 0..1; standard chroma/sector form of HSL -> RGB
+    if not math.isfinite(h):
+        raise ValueError('hsl() hue must be finite')
+    c = (1 - abs(2 * l - 1)) * s
+    h6 = (h / 60.0) % 6
+    vals = (c, c * (1 - abs(h6 % 2 - 1)), 0.0)
+    m = l - c / 2
+    # a tiny negative hue can make h6 round up to exactly 6.0
+    ri, gi, bi = _HSL_SECTORS[int(h6) % 6]
+    return (clamp255((vals[ri] + m) * 255), clamp255((vals[gi] + m) * 255), clamp255((vals[bi] + m) * 255))
 
 
 def rgb_to_hex(rgb):
     """Return uppercase #RRGGBB from an (r,g,b) tuple/list."""
-    r, g, b = (int(round(c)) for c in rgb)
-    r = max(0, min(255, r))
-    g = max(0, min(255, g))
-    b = max(0, min(255, b))
-    return "#{:02X}{:02X}{:02X}".format(r, g, b)
+    r, g, b = rgb
+    return "#" + _HEX2[clamp255(r)] + _HEX2[clamp255(g)] + _HEX2[clamp255(b)]
 
 
 def adjust_brightness(rgb, factor):
@@ -91,40 +122,56 @@ def normalize_name(text):
     """Lowercase, strip, collapse spaces and remove punctuation except '#', '()'"""
     if not text:
         return ""
-    s = text.lower().strip()
-    s = re.sub(r"[\t\n\r]+", " ", s)
-    s = re.sub(r"[^a-z0-9#(),\s-]", " ", s)
-    s = re.sub(r"[-_]+", " ", s)
-    s = re.sub(r"\s+", " ", s)
-    return s
+    s = text.lower().strip().translate(_NAME_TRANSLATE)
+    s = _NAME_STRIP_RE.sub(" ", s)
+    return _WS_RE.sub(" ", s).strip()
 
 
-def image_dominant_rgb(file_stream, resize_for_speed=(150, 150)):
+# JPEG draft size for uploads; large enough for the 150x150 dominant-color pass and the
+# 200x150 preview. Every upload path drafts to this so they see the same decoded pixels.
+UPLOAD_DRAFT_SIZE = (200, 150)
+
+
+def open_rgb_image(file_stream, draft_size=UPLOAD_DRAFT_SIZE):
+    """Open an image as RGB, compositing any alpha onto white."""
     im = Image.open(file_stream)
+    # Let JPEG decode straight at reduced scale instead of full resolution
+    try:
+        im.draft('RGB', draft_size)
+    except Exception:
+        pass
     # Composite alpha onto white
     if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
         bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
         im = im.convert("RGBA")
         bg.paste(im, mask=im.split()[-1])
-        im = bg.convert("RGB")
-    else:
-        im = im.convert("RGB")
+        return bg.convert("RGB")
+    return im.convert("RGB")
+
+
+def image_dominant_rgb(file_stream, resize_for_speed=(150, 150)):
+    draft_size = tuple(max(a, b) for a, b in zip(UPLOAD_DRAFT_SIZE, resize_for_speed))
+    return dominant_rgb(open_rgb_image(file_stream, draft_size), resize_for_speed)
+
 
+def dominant_rgb(im, resize_for_speed=(150, 150)):
+    """Most frequent color of an already opened RGB image."""
     im = im.resize(resize_for_speed, Image.Resampling.BILINEAR)
-    maxcolors = resize_for_speed[0] * resize_for_speed[1] + 1
-    colors = im.getcolors(maxcolors=maxcolors)
-    if colors:
-        dominant = max(colors, key=lambda t: t[0])[1]
-        return tuple(dominant[:3])
-    # fallback to adaptive palette
-    pal = im.convert('P', palette=Image.ADAPTIVE, colors=16)
-    palette = pal.getpalette()
-    color_counts = pal.getcolors()
-    dominant_index = max(color_counts, key=lambda t: t[0])[1]
-    r = palette[dominant_index * 3]
-    g = palette[dominant_index * 3 + 1]
-    b = palette[dominant_index * 3 + 2]
-    return (r, g, b)
+    # Pack each pixel into a single 24-bit int and count only the colors present
+    # (np.unique sorts in place of a 2^24-entry bincount table)
+    arr = np.asarray(im, dtype=np.uint8).reshape(-1, 3)
+    packed = arr[:, 0].astype(np.uint32) * 65536 + arr[:, 1].astype(np.uint32) * 256 + arr[:, 2]
+    vals, counts = np.unique(packed, return_counts=True)
+    idx = int(vals[counts.argmax()])
+    return (idx >> 16 & 0xFF, idx >> 8 & 0xFF, idx & 0xFF)
+
+
+def image_preview_jpeg(im, size=(200, 150), quality=70):
+    """Return a small JPEG thumbnail (bytes) for the page preview. Shrinks im in place."""
+    im.thumbnail(size)
+    buf = io.BytesIO()
+    im.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
 
 
 def try_imagecolor_getrgb(text):
@@ -140,18 +187,27 @@ def try_imagecolor_getrgb(text):
 
 def find_by_css3(name):
     """Exact CSS3 lookup (from webcolors or fallback table). Returns rgb or None."""
-    if not name:
-        return None
-    hexv = CSS3_NAMES_TO_HEX.get(name)
-    if hexv:
-        return try_imagecolor_getrgb(hexv)
-    return None
+    return CSS3_NAMES_TO_RGB.get(name)
 
 
 def fuzzy_lookup(name, n=3, cutoff=0.6):
     """Find close matches in KNOWN_NAMES and return the rgb of the best match if any."""
     if not KNOWN_NAMES:
         return None
+    if _FUZZY == 'rapidfuzz':
+        # fuzz.ratio is an Indel (LCS) similarity on a 0..100 scale. It is close to, but not
+        # the same as, difflib's matching-block ratio(), so the two backends can pick
+        # different names. Round the scaled cutoff so 0.55 means 55, not 55.00000000000001.
+        hits = _rf_process.extract(name, KNOWN_NAMES, scorer=_rf_fuzz.ratio, limit=None,
+                                   score_cutoff=round(cutoff * 100, 6))
+        # rank ties by name like get_close_matches does
+        for _, m in heapq.nlargest(n, ((score, m) for m, score, _ in hits)):
+            rgb = find_by_css3(m)
+            if rgb:
+                return rgb
+        return None
+    # get_close_matches builds its own SequenceMatcher per call (query as seq2, so its
+    # index is built once per query), which keeps this safe under threaded requests
     matches = difflib.get_close_matches(name, KNOWN_NAMES, n=n, cutoff=cutoff)
     for m in matches:
         rgb = find_by_css3(m)
@@ -164,6 +220,7 @@ def text_to_rgb_extended(text):
     """Robustly convert user-entered text to an (r,g,b) tuple.
 
     Strategies (in order):
+    - Exact CSS3 name lookup (cheap dict hit)
     - Direct ImageColor.getrgb (handles hex, rgb(), many color names)
     - Direct CSS3 lookup (webcolors)
     - Heuristics: remove adjectives (light/dark/pale/deep/very), try base token
@@ -175,6 +232,11 @@ def text_to_rgb_extended(text):
         raise ValueError("Empty color text")
 
     raw = text.strip()
+    # 0) plain CSS3 name: a dict hit, no regex or PIL parsing needed
+    rgb = CSS3_NAMES_TO_RGB.get(raw.lower())
+    if rgb:
+        return rgb
+
     norm = normalize_name(raw)
 
     # 1) direct attempt (handles '#rrggbb', 'rgb()', many CSS names already)
@@ -265,67 +327,62 @@ def parse_color_input(text, fallback_text_to_rgb_fn=None):
         raise ValueError("Empty color input")
 
     s = text.strip()
+    low = s.lower()
+
+    # Dispatch on the shape of the input so each branch runs only the parsing it needs.
+    # 1) hex with or without '#' ('f0f', '#ff00ff'): decode inline
+    digits = low[1:] if low[0] == '#' else low
+    if len(digits) in (3, 6) and all(c in HEX_DIGITS for c in digits):
+        if len(digits) == 3:
+            digits = digits[0] * 2 + digits[1] * 2 + digits[2] * 2
+        return (int(digits[0:2], 16), int(digits[2:4], 16), int(digits[4:6], 16))
+
+    if low[0].isdigit():
+        # 2) plain numeric triples like '255,0,0' or '255 0 0'
+        m = PLAIN_RGB_RE.match(s)
+        if m:
+            r = clamp255(int(m.group(1)))
+            g = clamp255(int(m.group(2)))
+            b = clamp255(int(m.group(3)))
+            return (r, g, b)
+    else:
+        # 3) plain CSS3 name: a dict hit, no regex or PIL parsing needed
+        rgb = CSS3_NAMES_TO_RGB.get(low)
+        if rgb:
+            return rgb
 
-    # 1) PIL can parse many notations directly (#hex, 'red', 'rgb(...)')
-    try:
-        return try_imagecolor_getrgb(s)
-    except Exception:
-        pass
-
-    # 2) hex short like 'f0f'
-    m = HEX_SHORT_RE.match(s)
-    if m:
-        g = m.group(1)
-        r = g[0] * 2
-        gr = g[1] * 2
-        b = g[2] * 2
-        try:
-            return try_imagecolor_getrgb(f"#{r}{gr}{b}")
-        except Exception:
-            pass
-
-    # 3) hex long like 'ff00ff' (without #)
-    m = HEX_LONG_RE.match(s)
-    if m:
+        # 4) PIL can parse many notations directly ('rgb(...)', 'hsv(...)', '#rrggbbaa', names)
         try:
-            return try_imagecolor_getrgb('#' + m.group(1))
+            return try_imagecolor_getrgb(s)
         except Exception:
             pass
 
-    # 4) rgb(...) or rgba(...)
-    m = RGB_FUNC_RE.search(s)
-    if m:
-        parts = [p.strip() for p in m.group(1).split(',')]
-        if len(parts) < 3:
-            raise ValueError('rgb() needs 3 components')
-        r = parse_numeric_token(parts[0])
-        g = parse_numeric_token(parts[1])
-        b = parse_numeric_token(parts[2])
-        return (r, g, b)
-
-    # 5) hsl(...) or hsla(...)
-    m = HSL_FUNC_RE.search(s)
-    if m:
-        parts = [p.strip() for p in m.group(1).split(',')]
-        if len(parts) < 3:
-            raise ValueError('hsl() needs 3 components')
-        # allow '30' or '30deg' forms for hue
-        h_raw = parts[0].rstrip().lower()
-        h = float(h_raw.rstrip('deg')) if h_raw.endswith(
-            'deg') or h_raw.replace('.', '', 1).isdigit() else float(h_raw)
-        s_comp = parts[1].strip()
-        l_comp = parts[2].strip()
-        s_val = float(s_comp.rstrip('%')) / 100.0 if s_comp.endswith('%') else float(s_comp)
-        l_val = float(l_comp.rstrip('%')) / 100.0 if l_comp.endswith('%') else float(l_comp)
-        return hsl_to_rgb_tuple(h, s_val, l_val)
-
-    # 6) plain numeric triples like '255,0,0' or '255 0 0'
-    m = PLAIN_RGB_RE.match(s)
-    if m:
-        r = clamp255(int(m.group(1)))
-        g = clamp255(int(m.group(2)))
-        b = clamp255(int(m.group(3)))
-        return (r, g, b)
+        # 5) rgb(...)/rgba(...) PIL rejected, e.g. mixed percent and plain components
+        m = RGB_FUNC_RE.search(s) if '(' in s else None
+        if m:
+            parts = [p.strip() for p in m.group(1).split(',')]
+            if len(parts) < 3:
+                raise ValueError('rgb() needs 3 components')
+            r = parse_numeric_token(parts[0])
+            g = parse_numeric_token(parts[1])
+            b = parse_numeric_token(parts[2])
+            return (r, g, b)
+
+        # 6) hsl(...)/hsla(...) PIL rejected, e.g. '30deg' hue or fractional s/l
+        m = HSL_FUNC_RE.search(s) if '(' in s else None
+        if m:
+            parts = [p.strip() for p in m.group(1).split(',')]
+            if len(parts) < 3:
+                raise ValueError('hsl() needs 3 components')
+            # allow '30' or '30deg' forms for hue
+            h_raw = parts[0].rstrip().lower()
+            h = float(h_raw.rstrip('deg')) if h_raw.endswith(
+                'deg') or h_raw.replace('.', '', 1).isdigit() else float(h_raw)
+            s_comp = parts[1].strip()
+            l_comp = parts[2].strip()
+            s_val = float(s_comp.rstrip('%')) / 100.0 if s_comp.endswith('%') else float(s_comp)
+            l_val = float(l_comp.rstrip('%')) / 100.0 if l_comp.endswith('%') else float(l_comp)
+            return hsl_to_rgb_tuple(h, s_val, l_val)
 
     # 7) fallback to provided fuzzy/name handler if given
     if fallback_text_to_rgb_fn:
@@ -334,6 +391,29 @@ def parse_color_input(text, fallback_text_to_rgb_fn=None):
     raise ValueError(f"Unrecognized color format: '{text}'")
 
 
+# Memoized entry points for the request handlers; color inputs repeat a lot
+# ("red", "#ff00ff") and both functions are pure.
+@lru_cache(maxsize=1024)
+def _text_to_rgb_cached(text):
+    return text_to_rgb_extended(text)
+
+
+@lru_cache(maxsize=1024)
+def _parse_cached(text):
+    return parse_color_input(text, fallback_text_to_rgb_fn=_text_to_rgb_cached)
+
+
+# Only short inputs are memoized so arbitrary request bodies can't be pinned in the caches
+_CACHE_MAX_INPUT_LEN = 64
+
+
+def parse_color_text(text):
+    """parse_color_input with name/fuzzy fallback, memoized for short inputs."""
+    if len(text) <= _CACHE_MAX_INPUT_LEN:
+        return _parse_cached(text)
+    return parse_color_input(text, fallback_text_to_rgb_fn=text_to_rgb_extended)
+
+
 # ---------- Flask Template (kept compact) ----------
 HTML = """
 <!doctype html>
@@ -385,10 +465,10 @@ HTML = """
       <button class="btn btn-sm btn-outline-secondary" id="copyBtn">Copy</button>
       &nbsp;<span class="swatch" id="swatch" style="background-color: {{ hex_result }};"></span></p>
       <p><strong>RGB:</strong> {{ rgb_result }}</p>
-      {% if preview_data %}
+      {% if preview_id %}
       <div>
         <strong>Uploaded image preview:</strong><br>
-        <img class="preview-img" src="data:{{ preview_mime }};base64,{{ preview_data }}" alt="preview">
+        <img class="preview-img" src="{{ url_for('preview', preview_id=preview_id) }}" alt="preview">
       </div>
       {% endif %}
       {% endif %}
@@ -406,13 +486,69 @@ HTML = """
 </html>
 """
 
+# Compile once at import instead of going through render_template_string per request
+_TEMPLATE = app.jinja_env.from_string(HTML)
+
+# Recent preview thumbnails served by /preview/<id>, oldest evicted first
+_PREVIEWS = OrderedDict()
+_PREVIEWS_MAX = 64
+# Guards _PREVIEWS and _IMG_CACHE; request handlers run on multiple threads
+_CACHE_LOCK = threading.Lock()
+
+
+def store_preview(data):
+    """Keep preview bytes in memory and return the id used to fetch them."""
+    preview_id = uuid.uuid4().hex
+    with _CACHE_LOCK:
+        _PREVIEWS[preview_id] = data
+        while len(_PREVIEWS) > _PREVIEWS_MAX:
+            _PREVIEWS.popitem(last=False)
+    return preview_id
+
+
+# Results for recently uploaded images, keyed by a hash of the upload bytes
+_IMG_CACHE = OrderedDict()
+_IMG_CACHE_MAX = 64
+
+
+def upload_digest(file_stream):
+    """Hash an upload in chunks (blake2b, 16 bytes) and rewind the stream."""
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: file_stream.read(1 << 16), b''):
+        h.update(chunk)
+    file_stream.seek(0)
+    return h.digest()
+
+
+def process_upload(file_stream):
+    """Return (rgb, preview_id) for an uploaded image, reusing results for repeat uploads."""
+    key = upload_digest(file_stream)
+    with _CACHE_LOCK:
+        hit = _IMG_CACHE.get(key)
+        # the preview may have been evicted independently; recompute in that case
+        if hit and hit[1] in _PREVIEWS:
+            # refresh both entries so the preview about to be shown is the last evicted
+            _IMG_CACHE.move_to_end(key)
+            _PREVIEWS.move_to_end(hit[1])
+            return hit
+    # Decode once for both the dominant color and the preview, which is a
+    # re-encoded thumbnail, not the upload
+    im = open_rgb_image(file_stream)
+    rgb = dominant_rgb(im)
+    result = (rgb, store_preview(image_preview_jpeg(im)))
+    with _CACHE_LOCK:
+        _IMG_CACHE[key] = result
+        _IMG_CACHE.move_to_end(key)
+        while len(_IMG_CACHE) > _IMG_CACHE_MAX:
+            _IMG_CACHE.popitem(last=False)
+    return result
+
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     hex_result = None
     rgb_result = None
-    preview_b64 = None
-    preview_mime = None
+    preview_id = None
 
     if request.method == 'POST':
         file = request.files.get('image_file')
@@ -420,10 +556,7 @@ def index():
 
         if file and file.filename:
             try:
-                raw = file.read()
-                preview_b64 = base64.b64encode(raw).decode('ascii')
-                preview_mime = file.mimetype or 'image/png'
-                rgb = image_dominant_rgb(io.BytesIO(raw))
+                rgb, preview_id = process_upload(file.stream)
                 hexcode = rgb_to_hex(rgb)
                 hex_result = hexcode
                 rgb_result = f"({rgb[0]}, {rgb[1]}, {rgb[2]})"
@@ -432,7 +565,7 @@ def index():
         elif color_text:
             try:
                 # Use the robust parser which prefers explicit formats and falls back to fuzzy names
-                rgb = parse_color_input(color_text, fallback_text_to_rgb_fn=text_to_rgb_extended)
+                rgb = parse_color_text(color_text)
                 hexcode = rgb_to_hex(rgb)
                 hex_result = hexcode
                 rgb_result = f"({rgb[0]}, {rgb[1]}, {rgb[2]})"
@@ -441,7 +574,16 @@ def index():
         else:
             flash('Please upload an image or enter a color name/hex.')
 
-    return render_template_string(HTML, hex_result=hex_result, rgb_result=rgb_result, preview_data=preview_b64, preview_mime=preview_mime)
+    return _TEMPLATE.render(request=request, hex_result=hex_result, rgb_result=rgb_result, preview_id=preview_id)
+
+
+@app.route('/preview/<preview_id>')
+def preview(preview_id):
+    with _CACHE_LOCK:
+        data = _PREVIEWS.get(preview_id)
+    if data is None:
+        abort(404)
+    return send_file(io.BytesIO(data), mimetype='image/jpeg')
 
 
 @app.route('/api/hex', methods=['GET', 'POST'])
@@ -464,14 +606,13 @@ def api_hex():
     # try image upload
     if 'image_file' in request.files:
         try:
-            raw = request.files['image_file'].read()
-            rgb = image_dominant_rgb(io.BytesIO(raw))
+            rgb = image_dominant_rgb(request.files['image_file'].stream)
             return jsonify({'hex': rgb_to_hex(rgb), 'rgb': list(rgb), 'input': 'image_file'})
         except Exception as e:
             return jsonify({'error': str(e)}), 400
 
     try:
-        rgb = parse_color_input(q, fallback_text_to_rgb_fn=text_to_rgb_extended)
+        rgb = parse_color_text(q)
         return jsonify({'hex': rgb_to_hex(rgb), 'rgb': list(rgb), 'input': q})
     except Exception as e:
         return jsonify({'error': str(e)}), 400